@@ -1,6 +1,18 @@
+import os
+import tempfile
 import unittest
+from collections import defaultdict
 
-from src import MutableTrie, Trie
+from src import (
+    CompactTrie,
+    DoubleArrayTrie,
+    MutableStringTrie,
+    MutableTrie,
+    RadixTrie,
+    StringTrie,
+    Trie,
+    TrieSet,
+)
 
 
 class TestTrie(unittest.TestCase):
@@ -22,6 +34,26 @@ class TestTrie(unittest.TestCase):
         self.assertEqual(trie[self.B_KEY], self.B, "B")
         self.assertEqual(trie[self.C_KEY], self.C, "C")
 
+    def test_from_items_shared_path(self):
+        items = [
+            ((1, 2, 3), "a"),
+            ((1, 2), "b"),  # a prefix of the previous key
+            ((1, 2, 3, 4), "c"),  # the previous key is a prefix of this one
+            ((1, 2, 3, 4), "d"),  # repeated
+            ((2, 1), "e"),
+            ((1, 5), "f"),  # out of order
+        ]
+        trie = Trie.from_items(self.TERM, items)
+        expected = {
+            1: {2: {0: "b", 3: {0: "a", 4: {0: "d"}}}, 5: {0: "f"}},
+            2: {1: {0: "e"}},
+        }
+        self.assertEqual(trie.children, expected)
+
+    def test_from_items_empty_key(self):
+        with self.assertRaises(ValueError):
+            Trie.from_items(self.TERM, [((), "a")])
+
     def test_from_dict(self):
         dct = {self.A_KEY: self.A, self.B_KEY: self.B, self.C_KEY: self.C}
         trie = Trie.from_dict(self.TERM, dct)
@@ -43,6 +75,15 @@ class TestTrie(unittest.TestCase):
         default = "d"
         self.assertEqual(trie.get(bad_key, default), default)
 
+    def test_get_not_found_partial(self):
+        dct = {self.A_KEY: self.A, self.B_KEY: self.B, self.C_KEY: self.C}
+        trie = Trie.from_dict(self.TERM, dct)
+        bad_key = (1, 3, 4)
+        default = "d"
+        self.assertEqual(trie.get(bad_key, default), default)
+        with self.assertRaises(KeyError):
+            trie[bad_key]
+
     def test_keys(self):
         dct = {self.A_KEY: self.A, self.B_KEY: self.B, self.C_KEY: self.C}
         trie = Trie.from_dict(self.TERM, dct)
@@ -69,6 +110,38 @@ class TestTrie(unittest.TestCase):
         self.assertEqual(sub_trie.keys(), expected_keys)
         self.assertEqual(sub_trie.terminal_marker, trie.terminal_marker)
 
+    def test_finalize_leaves_values(self):
+        value = defaultdict(list)
+        trie = Trie.from_items(self.TERM, [((1,), value)])
+        self.assertIs(trie[(1,)], value)
+        self.assertIsNotNone(value.default_factory)
+
+    def test_get_subtrie_not_found(self):
+        dct = {self.A_KEY: self.A, self.B_KEY: self.B, self.C_KEY: self.C}
+        trie = Trie.from_dict(self.TERM, dct)
+        with self.assertRaises(KeyError):
+            trie.get_subtrie((1, 3))
+        self.assertEqual(set(trie.get_subtrie((1,)).keys()), {2})
+
+    def test_contains(self):
+        dct = {self.A_KEY: self.A, self.B_KEY: self.B, (3,): ""}
+        trie = Trie.from_dict(self.TERM, dct)
+        self.assertIn(self.A_KEY, trie)
+        self.assertIn((3,), trie)
+        self.assertNotIn((1, 2), trie)
+        self.assertNotIn(self.C_KEY, trie)
+
+    def test_specialize_length(self):
+        dct = {self.A_KEY: self.A, self.B_KEY: self.B, self.C_KEY: self.C}
+        trie = Trie.from_dict(self.TERM, dct)
+        get = trie.specialize_length(3)
+        self.assertEqual(get(self.B_KEY), self.B)
+        self.assertEqual(get(self.C_KEY), self.C)
+        self.assertEqual(get((1, 2, 3), "d"), "d")
+        self.assertIsNone(get((9, 9, 9)))
+        with self.assertRaises(ValueError):
+            get(self.A_KEY)
+
     def test_prefixes(self):
         dct = {self.A_KEY: self.A, self.B_KEY: self.B, self.C_KEY: self.C}
         trie = Trie.from_dict(self.TERM, dct)
@@ -85,6 +158,12 @@ class TestTrie(unittest.TestCase):
         actual = list(trie.prefixes())
         self.assertEqual(actual, expected)
 
+    def test_prefixes_from(self):
+        dct = {self.A_KEY: self.A, self.B_KEY: self.B, self.C_KEY: self.C}
+        trie = Trie.from_dict(self.TERM, dct)
+        expected = [[1, 2, 3], [1, 2, 3, 4], [1, 2, 4]]
+        self.assertEqual(list(trie.prefixes_from((1, 2))), expected)
+
 
 class TestMutableTree(TestTrie):
     def test_setitem(self):
@@ -96,6 +175,13 @@ class TestMutableTree(TestTrie):
         trie[D_KEY] = D
         self.assertEqual(D, trie[D_KEY])
 
+    def test_getitem_not_found(self):
+        dct = {self.A_KEY: self.A, self.B_KEY: self.B, self.C_KEY: self.C}
+        trie = MutableTrie.from_dict(self.TERM, dct)
+        with self.assertRaises(KeyError):
+            trie[(9, 9)]
+        self.assertEqual(set(trie.keys()), {1, 2})
+
     def test_delitem(self):
         dct = {
             self.A_KEY: self.A,
@@ -105,3 +191,232 @@ class TestMutableTree(TestTrie):
         trie = MutableTrie.from_dict(self.TERM, dct)
         del trie[self.C_KEY]
         self.assertIsNone(trie.get(self.C_KEY, None))
+
+
+class TestRadixTrie(unittest.TestCase):
+    DCT = {(1, 2, 3, 4): "a", (1, 2, 4): "b", (2, 2, 5): "c", (1, 2, 4, 5, 6): "d"}
+    TERM = 0
+
+    def test_compress(self):
+        trie = RadixTrie.from_dict(self.TERM, {(1, 2, 3, 4): "foo", (1, 5): "bar"})
+        expected = {1: ((), {2: ((3, 4), {0: "foo"}), 5: ((), {0: "bar"})})}
+        self.assertEqual(trie.children, expected)
+
+    def test_from_dict(self):
+        trie = RadixTrie.from_dict(self.TERM, self.DCT)
+        for key, value in self.DCT.items():
+            self.assertEqual(trie[key], value, key)
+        for bad_key in [(1, 2), (1, 2, 4, 5), (2, 2), (2, 3, 5), (3,)]:
+            self.assertNotIn(bad_key, trie)
+            self.assertIsNone(trie.get(bad_key, None), bad_key)
+
+    def test_get_subtrie(self):
+        trie = RadixTrie.from_dict(self.TERM, self.DCT)
+        sub_trie = trie.get_subtrie((1, 2, 4, 5))
+        self.assertIsInstance(sub_trie, RadixTrie)
+        self.assertEqual(set(sub_trie.keys()), {6})
+        self.assertEqual(sub_trie[(6,)], "d")
+        with self.assertRaises(KeyError):
+            trie.get_subtrie((2, 3))
+
+    def test_items(self):
+        trie = RadixTrie.from_dict(self.TERM, self.DCT)
+        subtries = dict(trie.items())
+        self.assertEqual(set(subtries), {1, 2})
+        self.assertEqual(subtries[2][(2, 5)], "c")
+
+    def test_specialize_length(self):
+        trie = RadixTrie.from_dict(self.TERM, self.DCT)
+        get = trie.specialize_length(3)
+        self.assertEqual(get((1, 2, 4)), "b")
+        self.assertEqual(get((2, 2, 5)), "c")
+        self.assertEqual(get((1, 2, 3), "x"), "x")
+        with self.assertRaises(ValueError):
+            get((1, 2, 3, 4))
+
+    def test_prefixes(self):
+        dct = {(1, 2, 3): "a", (1, 4): "b"}
+        trie = RadixTrie.from_dict(self.TERM, dct)
+        expected = [[1], [1, 2], [1, 2, 3], [1, 4]]
+        self.assertEqual(list(trie.prefixes()), expected)
+        self.assertEqual(list(trie.prefixes_from((1, 2))), [[1, 2, 3]])
+
+
+class TestTrieSet(unittest.TestCase):
+    def test_is_prefix(self):
+        trie = TrieSet.from_keys(0, [(1, 2, 3), (1, 4)])
+        self.assertIn((1, 2, 3), trie)
+        self.assertNotIn((1, 2), trie)
+        self.assertTrue(trie.is_prefix((1, 2)))
+        self.assertTrue(trie.is_prefix((1, 4)))
+        self.assertFalse(trie.is_prefix((2,)))
+        self.assertFalse(trie.is_prefix((1, 2, 3, 4)))
+
+
+class TestStringTrie(unittest.TestCase):
+    DCT = {"ace": 1, "act": 2, "cab": 3}
+
+    def test_from_dict(self):
+        trie = StringTrie.from_dict(self.DCT)
+        for key, value in self.DCT.items():
+            self.assertEqual(trie[key], value, key)
+        self.assertEqual(trie.get("ac", None), None)
+        self.assertEqual(trie.get("xyz", None), None)
+
+    def test_keys(self):
+        trie = StringTrie.from_dict(self.DCT)
+        self.assertEqual(set(trie.keys()), {"a", "c"})
+
+    def test_get_subtrie(self):
+        trie = StringTrie.from_dict(self.DCT)
+        sub_trie = trie.get_subtrie("ac")
+        self.assertIsInstance(sub_trie, StringTrie)
+        self.assertEqual(set(sub_trie.keys()), {"e", "t"})
+        self.assertEqual(sub_trie["t"], 2)
+
+    def test_empty_key(self):
+        trie = StringTrie.from_dict(self.DCT)
+        with self.assertRaises(ValueError):
+            trie.get_subtrie("")
+        with self.assertRaises(ValueError):
+            list(trie.prefixes_from(""))
+        mutable = MutableStringTrie.from_dict(self.DCT)
+        with self.assertRaises(ValueError):
+            mutable[""] = 4
+        self.assertNotIn(-1, mutable.children)
+
+    def test_prefixes(self):
+        trie = StringTrie.from_dict(self.DCT)
+        expected = ["a", "ac", "ace", "act", "c", "ca", "cab"]
+        self.assertEqual(list(trie.prefixes()), expected)
+        self.assertEqual(list(trie.prefixes_from("ac")), ["ace", "act"])
+
+    def test_specialize_length(self):
+        trie = StringTrie.from_dict(self.DCT)
+        get = trie.specialize_length(3)
+        self.assertEqual(get("act"), 2)
+        self.assertIsNone(get("abc"))
+
+    def test_mutable(self):
+        trie = MutableStringTrie.from_dict(self.DCT)
+        trie["cat"] = 4
+        self.assertEqual(trie["cat"], 4)
+        del trie["ace"]
+        self.assertIsNone(trie.get("ace", None))
+
+
+class TestCompactTrie(unittest.TestCase):
+    DCT = {(1, 2, 3, 4): "a", (1, 2, 4): "b", (2, 2, 5): "c", (1, 2): "d"}
+    TERM = 0
+    CLS = CompactTrie
+    ARRAYS = ("labels", "child_off")
+
+    def test_from_dict(self):
+        trie = self.CLS.from_dict(self.TERM, self.DCT)
+        for key, value in self.DCT.items():
+            self.assertEqual(trie[key], value, key)
+        self.assertEqual(len(trie), len(self.DCT))
+
+    def test_not_found(self):
+        trie = self.CLS.from_dict(self.TERM, self.DCT)
+        for bad_key in [(1,), (1, 3), (2, 2, 5, 6), (9,)]:
+            self.assertIsNone(trie.get(bad_key, None), bad_key)
+            self.assertNotIn(bad_key, trie)
+            with self.assertRaises(KeyError):
+                trie[bad_key]
+
+    def test_narrow_arrays(self):
+        trie = self.CLS.from_dict(self.TERM, self.DCT)
+        for name in self.ARRAYS:
+            self.assertEqual(getattr(trie, name).itemsize, 1, name)
+        keys = [(i, j) for i in range(300) for j in range(3)]
+        trie = self.CLS.from_items(self.TERM, ((k, k) for k in keys))
+        for name in self.ARRAYS:
+            self.assertEqual(getattr(trie, name).itemsize, 2, name)
+        self.assertEqual(trie[(299, 2)], (299, 2))
+
+    def test_get_batch(self):
+        trie = self.CLS.from_dict(self.TERM, self.DCT)
+        keys = [(1, 2), (1, 2, 3, 4), (1, 3), (1, 2, 4), [2, 2, 5], (9,), (1, 2)]
+        expected = ["d", "a", None, "b", "c", None, "d"]
+        self.assertEqual(trie.get_batch(keys), expected)
+        self.assertEqual(trie.get_batch([(1, 3, 4), (1, 3)], "x"), ["x", "x"])
+
+    def test_from_trie(self):
+        trie = self.CLS.from_trie(Trie.from_dict(self.TERM, self.DCT))
+        for key, value in self.DCT.items():
+            self.assertIn(key, trie)
+            self.assertEqual(trie[key], value, key)
+
+    def test_from_string_trie(self):
+        words = {"a": 1, "an": 2, "bee": 3, "been": 4}
+        trie = self.CLS.from_trie(StringTrie.from_dict(words))
+        for key, value in words.items():
+            self.assertEqual(trie.get(key, None), value, key)
+        self.assertNotIn("be", trie)
+
+    def test_from_radix_trie(self):
+        trie = self.CLS.from_trie(RadixTrie.from_dict(self.TERM, self.DCT))
+        for key, value in self.DCT.items():
+            self.assertEqual(trie[key], value, key)
+        self.assertNotIn((1, 2, 3), trie)
+        self.assertEqual(len(trie), len(self.DCT))
+
+
+class TestDoubleArrayTrie(TestCompactTrie):
+    CLS = DoubleArrayTrie
+    ARRAYS = ("base", "check")
+
+    def test_check_stays_signed(self):
+        # Free slots hold -1 in `check`
+        trie = self.CLS.from_dict(self.TERM, self.DCT)
+        self.assertTrue(trie.check.typecode.islower())
+        self.assertIn(-1, trie.check)
+
+    def test_strings(self):
+        words = ["a", "an", "and", "ant", "bee", "been", "beet", "cab", "zebra"]
+        trie = self.CLS.from_items("", ((w, i) for i, w in enumerate(words)))
+        for i, word in enumerate(words):
+            self.assertEqual(trie[word], i, word)
+        for bad_key in ["b", "be", "ants", "c", "zeb", "q"]:
+            self.assertNotIn(bad_key, trie)
+
+
+class TestCompactTrieFile(unittest.TestCase):
+    DCT = {(1, 2, 3, 4): "a", (1, 2, 4): "b", (2, 2, 5): "c", (1, 2): "d"}
+    TERM = 0
+
+    def test_dump_load(self):
+        trie = CompactTrie.from_dict(self.TERM, self.DCT)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "trie.bin")
+            trie.dump(path)
+            with CompactTrie.load(path) as loaded:
+                for key, value in self.DCT.items():
+                    self.assertEqual(loaded[key], value, key)
+                self.assertNotIn((1, 3), loaded)
+                self.assertEqual(len(loaded), len(self.DCT))
+            with self.assertRaises(ValueError):
+                loaded.get((1, 2), None)
+
+    def test_load_not_a_trie(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "trie.bin")
+            with open(path, "wb") as f:
+                f.write(bytes(64))
+            with self.assertRaises(ValueError):
+                CompactTrie.load(path)
+
+    def test_load_truncated(self):
+        trie = CompactTrie.from_dict(self.TERM, self.DCT)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "trie.bin")
+            trie.dump(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            # The last section is padded to 8 bytes, so cut at least that much
+            for size in (20, 60, len(data) - 8):
+                with open(path, "wb") as f:
+                    f.write(data[:size])
+                with self.assertRaises(ValueError, msg=size):
+                    CompactTrie.load(path)
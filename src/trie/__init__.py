@@ -1,10 +1,21 @@
 """Trie implementation"""
 
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable, Sequence
 from collections import defaultdict
+from functools import cache
 from typing import Hashable, Self, TypeVar
 
-__all__ = ["Trie", "MutableTrie", "StringTrie", "MutableStringTrie"]
+from .compact import CompactTrie, DoubleArrayTrie
+
+__all__ = [
+    "Trie",
+    "MutableTrie",
+    "StringTrie",
+    "MutableStringTrie",
+    "CompactTrie",
+    "DoubleArrayTrie",
+    "RadixTrie",
+]
 
 
 NonTerminal = TypeVar("NonTerminal", bound=Hashable)
@@ -16,6 +27,30 @@ class HashableIterable[NonTerminal](Iterable[NonTerminal], Hashable):
     pass
 
 
+@cache
+def _make_fixed_length_get(n: int, element: str) -> Callable:
+    """Compile a factory for `get` functions that look up keys of length `n`
+    with the loop unrolled. `element` is an expression for the `i`th branch
+    of `key`, e.g. `"key[{i}]"`.
+    """
+    lines = [
+        "def make(children, marker):",
+        "    def get(key, default=None, _g=dict.get):",
+        f"        if len(key) != {n}:",
+        f"            raise ValueError('Expected a key of length {n}')",
+        "        level = children",
+    ]
+    for i in range(n):
+        lines.append(f"        level = _g(level, {element.format(i=i)})")
+        lines.append("        if level is None:")
+        lines.append("            return default")
+    lines.append("        return _g(level, marker, default)")
+    lines.append("    return get")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["make"]
+
+
 class Trie[TerminalValue, NonTerminal]:
     """The Trie is generic in its leaves and in its branches.
     Branches are of type `NonTerminal`, leaves are of type `TerminalValue`
@@ -67,26 +102,28 @@ class Trie[TerminalValue, NonTerminal]:
         then `([1, 2, 3, 4], "foo")` -> `{1: {2: {3: {4: {0: "foo"}}}}}`
         """
         children = cls.make_children()
-        for key, terminal in items:
-            level = cls.iter_key(children, key)
-            level[terminal_marker] = terminal
-        frozen = cls.finalize(children)
+        cls.insert_items(children, terminal_marker, items)
+        frozen = cls.finalize(children, terminal_marker)
         return cls(terminal_marker, frozen)
 
     def get(self, key: Iterable[NonTerminal], default: R) -> TerminalValue | R:
         """Retrieve a value from the trie, or `default` if the (entire) `key`
         isn't found
         """
-        return self._subtrie(key).get(self.terminal_marker, default)
+        level = self._find(key)
+        if level is None:
+            return default
+        return level.get(self.terminal_marker, default)
 
     def __getitem__(self, key: Iterable[NonTerminal]) -> TerminalValue:
         """Retrieve a value from the trie, raising a `KeyError` if the (entire)
         `key` isn't found
         """
-        try:
-            return self._subtrie(key)[self.terminal_marker]
-        except KeyError:
+        marker = self.terminal_marker
+        level = self._find(key)
+        if level is None or marker not in level:
             raise KeyError(key)
+        return level[marker]
 
     def get_subtrie(self, key: Iterable[NonTerminal]) -> Self:
         """Get a new Trie corresponding to the subtrie at `key`
@@ -103,25 +140,42 @@ class Trie[TerminalValue, NonTerminal]:
         """`(E, T)` tuples, where `E` is the 0th element of a key and `T`
         is the corresponding subtrie
         """
+        marker = self.terminal_marker
         for k, v in self.children.items():
-            yield (k, Trie(self.terminal_marker, v))
+            yield (k, Trie(marker, v))
 
     def __contains__(self, item: Iterable[NonTerminal]) -> bool:
-        return bool(self.get(item, False))
+        level = self._find(item)
+        return level is not None and self.terminal_marker in level
 
     def _subtrie(self, key: Iterable[NonTerminal]) -> dict:
         return self.iter_key(self.children, key)
 
+    def _find(self, key: Iterable[NonTerminal]) -> dict | None:
+        """Walk `key` without raising (or, for `defaultdict`s, inserting),
+        returning the sub-trie at `key` or `None` if it isn't present
+        """
+        level = self.children
+        for k in key:
+            level = level.get(k)
+            if level is None:
+                return None
+        return level
+
     @classmethod
-    def finalize(cls, children: defaultdict):
-        """Finalize `children` by recursively casting to `dict`"""
-        d = {}
-        for k, v in children.items():
-            if isinstance(v, defaultdict):
-                d[k] = cls.finalize(v)
-            else:
-                d[k] = v
-        return d
+    def finalize(cls, children: defaultdict, terminal_marker: NonTerminal):
+        """Finalize `children` in place by clearing every `default_factory`,
+        so that missing keys raise rather than inserting new levels.
+        Values stored at `terminal_marker` are left alone.
+        """
+        stack = [children]
+        while stack:
+            d = stack.pop()
+            d.default_factory = None
+            for k, v in d.items():
+                if k != terminal_marker:
+                    stack.append(v)
+        return children
 
     @classmethod
     def make_children(cls) -> defaultdict:
@@ -130,34 +184,106 @@ class Trie[TerminalValue, NonTerminal]:
         """
         return defaultdict(cls.make_children)
 
+    @staticmethod
+    def insert_items(
+        children: defaultdict,
+        terminal_marker: NonTerminal,
+        items: Iterable[(Iterable[NonTerminal], TerminalValue)],
+    ):
+        """Insert `items` into the unfinalized `children`.
+        The levels along the previous key are kept, so a key only descends
+        from where it diverges from its predecessor; sorted input walks each
+        edge once.
+        """
+        path = [children]
+        prev = ()
+        for key, terminal in items:
+            ks = key if isinstance(key, tuple) else tuple(key)
+            if not ks:
+                raise ValueError("Empty key")
+            n = min(len(prev), len(ks))
+            shared = 0
+            while shared < n and prev[shared] == ks[shared]:
+                shared += 1
+            del path[shared + 1 :]
+            level = path[-1]
+            for k in ks[shared:]:
+                level = level[k]
+                path.append(level)
+            level[terminal_marker] = terminal
+            prev = ks
+
     @staticmethod
     def iter_key(children: dict, key: Iterable[NonTerminal]) -> TerminalValue | dict:
-        [fst, *rest] = key
-        curr_level = children
-        while len(rest) > 0:
-            old_level = curr_level
-            curr_level = old_level[fst]
-            [fst, *rest] = rest
-        return curr_level[fst]
-
-    def _prefixes(self, k: Iterable[NonTerminal]) -> Iterable[Iterable[NonTerminal]]:
-        yield k
-        for key, value in self._subtrie(k).items():
-            if key == self.terminal_marker:
-                continue
-            k2 = k + key
-            yield from self._prefixes(k2)
+        # Step through `key` one element behind, so that the final element
+        # can be looked up on its own without copying or re-unpacking `key`
+        it = iter(key)
+        for fst in it:
+            break
+        else:
+            raise ValueError("Empty key")
+        level = children
+        for nxt in it:
+            level = level[fst]
+            fst = nxt
+        return level[fst]
+
+    @staticmethod
+    def decode_path(path: list) -> Iterable[NonTerminal]:
+        """Convert a path of branches back into a key"""
+        return list(path)
+
+    @staticmethod
+    def _pool_key(k: NonTerminal) -> NonTerminal:
+        """The key element a branch stands for, when flattening the trie"""
+        return k
+
+    @staticmethod
+    def _pool_edge(v: dict) -> dict:
+        """The level a branch leads to one key element on, when flattening
+        the trie
+        """
+        return v
+
+    def _prefixes(self, level: dict, path: list) -> Iterable[Iterable[NonTerminal]]:
+        """Every key below `level`, depth-first. `path` is the key of `level`;
+        it's extended and truncated in place, and only copied on `yield`
+        """
+        marker = self.terminal_marker
+        decode_path = self.decode_path
+        stack = [iter(level.items())]
+        while stack:
+            for k, v in stack[-1]:
+                if k != marker:
+                    path.append(k)
+                    yield decode_path(path)
+                    stack.append(iter(v.items()))
+                    break
+            else:
+                stack.pop()
+                if stack:
+                    path.pop()
 
     def prefixes(self) -> Iterable[Iterable[NonTerminal]]:
-        for key in self.keys():
-            yield from self._prefixes(key)
+        return self._prefixes(self.children, [])
 
     def prefixes_from(
         self, key: Iterable[NonTerminal]
     ) -> Iterable[Iterable[NonTerminal]]:
-        gen = self._prefixes(key)
-        next(gen)  # skip `key`
-        yield from gen
+        return self._prefixes(self._subtrie(key), list(key))
+
+    # How `specialize_length` indexes the `i`th branch of a key
+    _key_element = "key[{i}]"
+
+    def specialize_length(
+        self, n: int
+    ) -> Callable[[Sequence[NonTerminal], R], TerminalValue | R]:
+        """A `get(key, default=None)` for keys of exactly length `n`, with
+        the descent unrolled into straight-line code. The code is compiled
+        once per length and shared between tries.
+        """
+        make = _make_fixed_length_get(n, self._key_element)
+        return make(self.children, self.terminal_marker)
 
 
 class MutableTrie(Trie[TerminalValue, NonTerminal]):
@@ -166,59 +292,100 @@ class MutableTrie(Trie[TerminalValue, NonTerminal]):
     # Left as `defaultdict` for easier insertion
     children: defaultdict
 
-    def __getitem__(self, key: Iterable[NonTerminal]) -> TerminalValue:
-        # `defaultdict.__getitem__` doesn't behave like we want
-        value = self._subtrie(key).get(self.terminal_marker, None)
-        if value is None:
-            raise KeyError(key)
-        return value
-
     def __setitem__(self, key: Iterable[NonTerminal], value: TerminalValue):
-        level = self.iter_key(self.children, key)
+        level = self._subtrie(key)
         level[self.terminal_marker] = value
 
     def __delitem__(self, key: Iterable[NonTerminal]):
-        level = self.iter_key(self.children, key)
+        level = self._subtrie(key)
         del level[self.terminal_marker]
 
     @classmethod
-    def finalize(cls, children: defaultdict):
+    def finalize(cls, children: defaultdict, terminal_marker: NonTerminal):
         """Leave `children` as a `defaultdict`"""
         return children
 
 
 class StringTrie(Trie[TerminalValue, str]):
-    """A `Trie` whose keys are strings and whose `terminal_marker` is always
-    the empty string.
+    """A `Trie` whose keys are strings.
+    Branches are keyed by integer codepoints rather than 1-character strings,
+    and the `terminal_marker` is always `-1` (which is never a codepoint).
     """
 
-    # Always the empty string
-    terminal_marker: str
+    # Always -1
+    terminal_marker: int
 
     def __init__(self, children):
-        super().__init__("", children)
+        super().__init__(-1, children)
 
     @classmethod
     def from_dict(cls, dct: dict[str, TerminalValue]):
-        # `terminal_marker` is always the empty string
+        # `terminal_marker` is always -1
         return cls.from_items(dct.items())
 
     @classmethod
     def from_items(cls, items: Iterable[(str, TerminalValue)]):
-        # `terminal_marker` is always the empty string
+        # `terminal_marker` is always -1
         children = cls.make_children()
-        for key, terminal in items:
-            level = cls.iter_key(children, key)
-            level[""] = terminal
-        frozen = cls.finalize(children)
+        cls.insert_items(children, -1, ((cls.encode_key(k), v) for k, v in items))
+        frozen = cls.finalize(children, -1)
         return cls(frozen)
 
+    @staticmethod
+    def encode_key(key: str) -> tuple[int, ...]:
+        """Convert a string key to the codepoints used to branch"""
+        return tuple(map(ord, key))
+
+    def get_subtrie(self, key: str) -> Self:
+        return StringTrie(self._subtrie(key))
+
+    def keys(self):
+        """The 0th character of every key in the Trie"""
+        return [chr(k) for k in self.children if k != -1]
+
+    def items(self):
+        """`(C, T)` tuples, where `C` is the 0th character of a key and `T`
+        is the corresponding subtrie
+        """
+        for k, v in self.children.items():
+            if k != -1:
+                yield (chr(k), StringTrie(v))
+
+    # `_subtrie` and `_find` walk `key` itself and call `ord` inline, which is
+    # cheaper than building `encode_key(key)` or iterating over `map(ord, key)`
+    def _subtrie(self, key: str) -> dict:
+        if not key:
+            raise ValueError("Empty key")
+        level = self.children
+        for c in key:
+            level = level[ord(c)]
+        return level
+
+    def _find(self, key: str) -> dict | None:
+        level = self.children
+        for c in key:
+            level = level.get(ord(c))
+            if level is None:
+                return None
+        return level
+
+    @staticmethod
+    def decode_path(path: list[int]) -> str:
+        return "".join(map(chr, path))
+
+    _pool_key = staticmethod(chr)
+
+    def prefixes_from(self, key: str) -> Iterable[str]:
+        return self._prefixes(self._subtrie(key), list(self.encode_key(key)))
+
+    _key_element = "ord(key[{i}])"
+
 
 class MutableStringTrie(StringTrie[TerminalValue], MutableTrie[TerminalValue, str]):
     """A string-keyed `Trie` that supports post-creation mutability."""
 
     def __init__(self, children):
-        super(StringTrie).__init__(children)
+        super().__init__(children)
 
 
 class TrieSet(Trie[bool, NonTerminal]):
@@ -229,11 +396,135 @@ class TrieSet(Trie[bool, NonTerminal]):
     def from_keys(
         cls, terminal_marker: NonTerminal, keys: Iterable[Iterable[NonTerminal]]
     ) -> Self:
-        return cls.from_items((k, True) for k in keys)
-
-    def is_prefix(self, k: Iterable[NonTerminal]):
-        try:
-            self._subtrie(k)
-            return True
-        except KeyError:
-            return False
+        return cls.from_items(terminal_marker, ((k, True) for k in keys))
+
+    def is_prefix(self, k: Iterable[NonTerminal]) -> bool:
+        return self._find(k) is not None
+
+
+class RadixTrie(Trie[TerminalValue, NonTerminal]):
+    """A read-only `Trie` with unary chains compressed into single edges.
+    Each branch maps the first element of an edge to a `(tail, subtrie)`
+    tuple, where `tail` holds the rest of the edge's elements.
+
+    If `terminal_marker == 0`,
+    then `{(1, 2, 3, 4): "foo"}` -> `{1: ((2, 3, 4), {0: "foo"})}`
+    """
+
+    @classmethod
+    def from_items(
+        cls,
+        terminal_marker: NonTerminal,
+        items: Iterable[(Iterable[NonTerminal], TerminalValue)],
+    ):
+        trie = Trie.from_items(terminal_marker, items)
+        return cls(terminal_marker, cls.compress(terminal_marker, trie.children))
+
+    @staticmethod
+    def compress(terminal_marker: NonTerminal, children: dict) -> dict:
+        """Build the compressed form of the (uncompressed) `children`"""
+        root = {}
+        stack = [(children, root)]
+        while stack:
+            src, dst = stack.pop()
+            for k, v in src.items():
+                if k == terminal_marker:
+                    dst[k] = v
+                    continue
+                tail = []
+                while len(v) == 1:
+                    ((k2, v2),) = v.items()
+                    if k2 == terminal_marker:
+                        break
+                    tail.append(k2)
+                    v = v2
+                level = {}
+                dst[k] = (tuple(tail), level)
+                stack.append((v, level))
+        return root
+
+    @staticmethod
+    def _pool_edge(v: tuple) -> dict:
+        # Peel one element off the edge, leaving a radix-style level for the
+        # rest of it
+        tail, level = v
+        if tail:
+            return {tail[0]: (tail[1:], level)}
+        return level
+
+    def get_subtrie(self, key: Iterable[NonTerminal]) -> Self:
+        return RadixTrie(self.terminal_marker, self._subtrie(key))
+
+    def specialize_length(
+        self, n: int
+    ) -> Callable[[Sequence[NonTerminal], R], TerminalValue | R]:
+        # Compressed edges don't have one level per branch, so there's no
+        # descent to unroll; just check the length and walk as usual
+        find = self._find
+        marker = self.terminal_marker
+
+        def get(key, default=None):
+            if len(key) != n:
+                raise ValueError(f"Expected a key of length {n}")
+            level = find(key)
+            if level is None:
+                return default
+            return level.get(marker, default)
+
+        return get
+
+    def items(self):
+        marker = self.terminal_marker
+        for k, v in self.children.items():
+            if k == marker:
+                continue
+            tail, level = v
+            if tail:
+                level = {tail[0]: (tail[1:], level)}
+            yield (k, RadixTrie(marker, level))
+
+    def _subtrie(self, key: Iterable[NonTerminal]) -> dict:
+        level = self._find(key)
+        if level is None:
+            raise KeyError(key)
+        return level
+
+    def _find(self, key: Iterable[NonTerminal]) -> dict | None:
+        ks = key if isinstance(key, tuple) else tuple(key)
+        n = len(ks)
+        i = 0
+        level = self.children
+        while i < n:
+            edge = level.get(ks[i])
+            if edge is None:
+                return None
+            tail, level = edge
+            i += 1
+            m = min(len(tail), n - i)
+            if ks[i : i + m] != tail[:m]:
+                return None
+            i += m
+            if m < len(tail):
+                # `key` ends partway along this edge
+                return {tail[m]: (tail[m + 1 :], level)}
+        return level
+
+    def _prefixes(self, level: dict, path: list) -> Iterable[Iterable[NonTerminal]]:
+        marker = self.terminal_marker
+        decode_path = self.decode_path
+        # Iterators over each level, with how many elements their edge added
+        stack = [(iter(level.items()), 0)]
+        while stack:
+            for k, v in stack[-1][0]:
+                if k != marker:
+                    tail, child = v
+                    path.append(k)
+                    yield decode_path(path)
+                    for t in tail:
+                        path.append(t)
+                        yield decode_path(path)
+                    stack.append((iter(child.items()), len(tail) + 1))
+                    break
+            else:
+                _, n = stack.pop()
+                del path[len(path) - n :]
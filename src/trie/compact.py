@@ -0,0 +1,438 @@
+"""Flat, array-backed frozen tries"""
+
+import mmap
+import os
+import pickle
+import struct
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable
+from typing import Hashable, Self, TypeVar
+
+__all__ = ["CompactTrie", "DoubleArrayTrie"]
+
+
+NonTerminal = TypeVar("NonTerminal", bound=Hashable)
+TerminalValue = TypeVar("Terminal")
+R = TypeVar("R")
+
+# `CompactTrie.dump` file header: magic, byte order, the typecodes of `labels`
+# and `child_off`, then the lengths of `labels`, `child_off` and the pickled
+# `(alphabet, values)`
+_MAGIC = b"TRIECSR1"
+_HEADER = struct.Struct("<8sccc5xQQQ")
+
+# How many free slots `DoubleArrayTrie` tries for one node before it stops
+# considering the earliest free slot
+_MAX_PLACEMENT_TRIES = 16
+
+
+# Integer typecodes, narrowest first
+_TYPECODES = sorted("BbHhIiLlQq", key=lambda tc: array(tc).itemsize)
+
+
+def _narrow(a: array) -> array:
+    """Copy `a` into the narrowest integer typecode that holds its values"""
+    lo = min(a, default=0)
+    hi = max(a, default=0)
+    for tc in _TYPECODES:
+        bits = 8 * array(tc).itemsize
+        if tc.isupper():
+            fits = 0 <= lo and hi < 1 << bits
+        else:
+            fits = -(1 << bits - 1) <= lo and hi < 1 << bits - 1
+        if fits:
+            return array(tc, a)
+    raise OverflowError(f"Values from {lo} to {hi} don't fit in an array")
+
+
+def _pool_items(items):
+    """Insert `items` into a pool of nodes, where each node is a `dict` from
+    key element to the index of its child in the pool. Returns the pool and
+    a `dict` from node index to value.
+    """
+    pool = [{}]
+    values = {}
+    for key, value in items:
+        node = 0
+        for k in key:
+            level = pool[node]
+            child = level.get(k)
+            if child is None:
+                child = len(pool)
+                pool.append({})
+                level[k] = child
+            node = child
+        values[node] = value
+    return pool, values
+
+
+def _pool_trie(trie):
+    """Convert a `Trie` to the form returned by `_pool_items`, using the
+    trie's `_pool_key` and `_pool_edge` to read its branches
+    """
+    marker = trie.terminal_marker
+    pool_key = trie._pool_key
+    pool_edge = trie._pool_edge
+    pool = []
+    values = {}
+    queue = [trie.children]
+    for node, level in enumerate(queue):
+        kids = {}
+        for k, v in level.items():
+            if k == marker:
+                values[node] = v
+            else:
+                kids[pool_key(k)] = len(queue)
+                queue.append(pool_edge(v))
+        pool.append(kids)
+    return pool, values
+
+
+class _FlatTrie[TerminalValue, NonTerminal](ABC):
+    """Shared behavior for tries flattened into integer arrays. Subclasses
+    implement `_from_pool` and `_find`, which maps a key to a node index.
+    """
+
+    # Key element -> interned label
+    alphabet: dict
+
+    # Node index -> value, for just the nodes that complete a key
+    values: dict
+
+    @classmethod
+    def from_dict(
+        cls,
+        terminal_marker: NonTerminal,
+        dct: dict[Iterable[NonTerminal], TerminalValue],
+    ):
+        """Create a flat trie from a dictionary. See `Trie.from_dict`"""
+        return cls.from_items(terminal_marker, dct.items())
+
+    @classmethod
+    def from_items(
+        cls,
+        terminal_marker: NonTerminal,
+        items: Iterable[(Iterable[NonTerminal], TerminalValue)],
+    ):
+        """Create a flat trie from an iterable of `(key, value)` tuples.
+        See `Trie.from_items`. Values are kept apart from the branches, so
+        `terminal_marker` is only accepted for symmetry with `Trie`.
+        """
+        return cls._from_pool(*_pool_items(items))
+
+    @classmethod
+    def from_trie(cls, trie):
+        """Flatten an existing `Trie`"""
+        return cls._from_pool(*_pool_trie(trie))
+
+    @classmethod
+    @abstractmethod
+    def _from_pool(cls, pool: list[dict], terminals: dict):
+        """Build the trie from the output of `_pool_items`"""
+
+    def get(self, key: Iterable[NonTerminal], default: R) -> TerminalValue | R:
+        """Retrieve a value from the trie, or `default` if the (entire) `key`
+        isn't found
+        """
+        # `_find` returns -1 for missing keys, which is never in `values`
+        return self.values.get(self._find(key), default)
+
+    def __getitem__(self, key: Iterable[NonTerminal]) -> TerminalValue:
+        """Retrieve a value from the trie, raising a `KeyError` if the (entire)
+        `key` isn't found
+        """
+        try:
+            return self.values[self._find(key)]
+        except KeyError:
+            raise KeyError(key)
+
+    def __contains__(self, item: Iterable[NonTerminal]) -> bool:
+        return self._find(item) in self.values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get_batch(
+        self, keys: Iterable[Iterable[NonTerminal]], default: R = None
+    ) -> list[TerminalValue | R]:
+        """Retrieve the value of each of `keys`, or `default`"""
+        find = self._find
+        values = self.values
+        return [values.get(find(key), default) for key in keys]
+
+    @abstractmethod
+    def _find(self, key: Iterable[NonTerminal]) -> int:
+        """The node at `key`, or -1 if it isn't present"""
+
+
+class CompactTrie(_FlatTrie[TerminalValue, NonTerminal]):
+    """A read-only trie stored as flat arrays rather than nested `dict`s.
+
+    Nodes are numbered breadth-first, with the root as node 0. Every distinct
+    key element is interned to a small integer in `alphabet`, and the children
+    of node `i` are the (sorted) interned labels
+    `labels[child_off[i]:child_off[i + 1]]`. Because nodes are numbered in the
+    same order their incoming edges are laid out, the child reached through
+    `labels[j]` is node `j + 1`.
+    """
+
+    # Interned labels of every edge, grouped by parent node
+    labels: array
+
+    # Offsets into `labels`; one entry per node, plus one
+    child_off: array
+
+    def __init__(self, alphabet, labels, child_off, values):
+        """Create a new `CompactTrie`.
+        NOTE: Use `cls.from_dict`, `cls.from_items` or `cls.from_trie` instead.
+        """
+        self.alphabet = alphabet
+        self.labels = labels
+        self.child_off = child_off
+        self.values = values
+        # The file mapping backing `labels` and `child_off`, after `load`
+        self._mmap = None
+
+    @classmethod
+    def _from_pool(cls, pool: list[dict], terminals: dict):
+        """Renumber the pool breadth-first"""
+        alphabet = {}
+        labels = array("i")
+        child_off = array("i", [0])
+        values = {}
+        queue = [0]
+        # `queue` grows as we go, so this visits every node in BFS order
+        for node, idx in enumerate(queue):
+            if idx in terminals:
+                values[node] = terminals[idx]
+            kids = sorted(
+                (alphabet.setdefault(k, len(alphabet)), child)
+                for k, child in pool[idx].items()
+            )
+            for label, child in kids:
+                labels.append(label)
+                queue.append(child)
+            child_off.append(len(labels))
+        return cls(alphabet, _narrow(labels), _narrow(child_off), values)
+
+    def dump(self, path: str | os.PathLike):
+        """Write the trie to `path`, for `CompactTrie.load`"""
+        meta = pickle.dumps((self.alphabet, self.values))
+        labels = memoryview(self.labels)
+        child_off = memoryview(self.child_off)
+        byteorder = b"<" if sys.byteorder == "little" else b">"
+        with open(path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    _MAGIC,
+                    byteorder,
+                    labels.format.encode(),
+                    child_off.format.encode(),
+                    len(labels),
+                    len(child_off),
+                    len(meta),
+                )
+            )
+            # Every section starts 8-byte aligned
+            for section in (labels.tobytes(), child_off.tobytes(), meta):
+                f.write(section)
+                f.write(bytes(-len(section) % 8))
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> Self:
+        """Memory-map a trie written by `CompactTrie.dump`. `labels` and
+        `child_off` are `memoryview`s over the mapping, so pages are only read
+        in as lookups touch them, and are shared between processes mapping
+        the same file.
+        Call `close` (or use the trie as a context manager) to release the
+        mapping.
+        Raises `ValueError` if `path` isn't a complete `CompactTrie` file.
+        NOTE: The alphabet and values are unpickled; only load trusted files.
+        """
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(mm)
+        sections = []
+        try:
+            if len(mm) < _HEADER.size:
+                raise ValueError(f"{path} is not a CompactTrie file")
+            (
+                magic,
+                byteorder,
+                labels_tc,
+                child_off_tc,
+                n_labels,
+                n_child_off,
+                n_meta,
+            ) = _HEADER.unpack_from(mm)
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a CompactTrie file")
+            if byteorder != (b"<" if sys.byteorder == "little" else b">"):
+                raise ValueError(f"{path} was written with a different byte order")
+            layout = []
+            start = _HEADER.size
+            for tc, n in ((labels_tc, n_labels), (child_off_tc, n_child_off)):
+                tc = tc.decode()
+                end = start + n * array(tc).itemsize
+                layout.append((tc, start, end))
+                start = end + -end % 8
+            if start + n_meta > len(mm):
+                raise ValueError(f"{path} is truncated")
+            for tc, lo, hi in layout:
+                sections.append(buf[lo:hi].cast(tc))
+            with buf[start : start + n_meta] as meta:
+                alphabet, values = pickle.loads(meta)
+        except BaseException:
+            # The views have to go before the mapping can be closed
+            for view in sections:
+                view.release()
+            buf.release()
+            mm.close()
+            raise
+        labels, child_off = sections
+        trie = cls(alphabet, labels, child_off, values)
+        trie._mmap = mm
+        return trie
+
+    def close(self):
+        """Release the file mapping opened by `load`, if any. A loaded trie
+        can't be used once it's closed.
+        """
+        if self._mmap is None:
+            return
+        self.labels.release()
+        self.child_off.release()
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _find(self, key: Iterable[NonTerminal]) -> int:
+        alphabet = self.alphabet
+        labels = self.labels
+        child_off = self.child_off
+        node = 0
+        for k in key:
+            label = alphabet.get(k)
+            if label is None:
+                return -1
+            lo = child_off[node]
+            hi = child_off[node + 1]
+            if hi - lo == 1:
+                # Most nodes in deep, narrow tries have a single child, which
+                # is cheaper to compare directly than to search for
+                if labels[lo] != label:
+                    return -1
+                node = lo + 1
+                continue
+            j = bisect_left(labels, label, lo, hi)
+            if j == hi or labels[j] != label:
+                return -1
+            node = j + 1
+        return node
+
+
+class DoubleArrayTrie(_FlatTrie[TerminalValue, NonTerminal]):
+    """A read-only trie stored as a double array.
+
+    Each node is a slot in two parallel arrays. The child of node `s` through
+    interned label `c` lives at slot `t = base[s] + c`, and is only valid if
+    `check[t] == s`. A step therefore costs two array reads and no search,
+    at the price of some unused slots. The root is slot 0.
+    """
+
+    # Offset added to a child's label to find its slot
+    base: array
+
+    # The parent of each slot, or -1 for unused slots
+    check: array
+
+    def __init__(self, alphabet, base, check, values):
+        """Create a new `DoubleArrayTrie`.
+        NOTE: Use `cls.from_dict`, `cls.from_items` or `cls.from_trie` instead.
+        """
+        self.alphabet = alphabet
+        self.base = base
+        self.check = check
+        self.values = values
+
+    @classmethod
+    def _from_pool(cls, pool: list[dict], terminals: dict):
+        """Place the pool's nodes, breadth-first.
+        Each node's children are given the lowest base at which all of their
+        slots are free.
+        """
+        alphabet = {}
+        base = array("i", [0])
+        check = array("i", [-1])
+        values = {}
+        # Nonzero for slots that are taken; slot 0 is the root
+        used = bytearray(b"\x01")
+        # Every slot before `first_free` is in use
+        first_free = 1
+        queue = [(0, 0)]
+        for slot, idx in queue:
+            if idx in terminals:
+                values[slot] = terminals[idx]
+            kids = sorted(
+                (alphabet.setdefault(k, len(alphabet)), child)
+                for k, child in pool[idx].items()
+            )
+            if not kids:
+                continue
+            first = kids[0][0]
+            # Line the first child up with each free slot in turn, until the
+            # rest of the children land on free slots too
+            free = used.find(0, first_free)
+            tries = 0
+            while True:
+                if free < 0:
+                    free = max(len(used), first + 1)
+                b = free - first
+                if b >= 1 and not any(
+                    b + label < len(used) and used[b + label] for label, _ in kids
+                ):
+                    break
+                free = used.find(0, free + 1)
+                tries += 1
+            needed = b + kids[-1][0] + 1 - len(used)
+            if needed > 0:
+                base.extend([0] * needed)
+                check.extend([-1] * needed)
+                used.extend(bytes(needed))
+            base[slot] = b
+            for label, child in kids:
+                check[b + label] = slot
+                used[b + label] = 1
+                queue.append((b + label, child))
+            if tries > _MAX_PLACEMENT_TRIES:
+                # The free slots at the front are too scattered to be worth
+                # searching again; give up on the first of them
+                first_free += 1
+            first_free = used.find(0, first_free)
+            if first_free < 0:
+                first_free = len(used)
+        return cls(alphabet, _narrow(base), _narrow(check), values)
+
+    def _find(self, key: Iterable[NonTerminal]) -> int:
+        alphabet = self.alphabet
+        base = self.base
+        check = self.check
+        size = len(check)
+        node = 0
+        for k in key:
+            label = alphabet.get(k)
+            if label is None:
+                return -1
+            child = base[node] + label
+            if child >= size or check[child] != node:
+                return -1
+            node = child
+        return node